@@ -0,0 +1,428 @@
+'''
+Created on Oct 19, 2026
+
+@author: Rusty
+
+Benchmarks for the containers in queue_and_stack.  Every container is run
+through the workloads that match its order (LIFO, FIFO, random or priority) at
+several sizes.  Results are written to JSON and compared against a stored
+baseline.
+
+Each timing repeats the workload until it has run for at least MIN_TIME
+seconds.  Speed is compared as the median ratio to the reference container for
+the same order (collections.deque, list or heapq), timed right before each
+repeat, so the comparison does not depend on how busy the machine was.
+
+    python bench_queue_and_stack.py --output bench.json
+    python bench_queue_and_stack.py --save-baseline
+'''
+import argparse
+import collections
+import gc
+import heapq
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from random import randint, seed
+
+import queue_and_stack
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_BASELINE = 'bench_baseline.json'
+BURST_SIZE = 1000
+# minimum seconds each timing runs for, repeating the workload as needed
+MIN_TIME = 0.1
+# peak memory changes smaller than this are treated as noise
+MIN_PEAK_BYTES = 4096
+# report fields that must match the baseline for speeds to be comparable
+ENVIRONMENT = ('python', 'platform')
+
+
+def _list_random_pop(items):
+    """ Remove an item at a random position from a list by swapping with the end """
+    index = randint(0, len(items) - 1)
+    items[index], items[-1] = items[-1], items[index]
+    return items.pop()
+
+
+def _spilling_queue():
+    """ Spilling queue with a budget small enough to spill at the larger sizes """
+    return queue_and_stack.SpillingQueue(memory_budget=20000)
+
+
+class _LatestVersion:
+    """ Keeps the latest version of a persistent container so it can be driven
+        like the mutable ones.  Old versions are dropped straight away. """
+    def __init__(self, container):
+        self.container = container
+
+    def push(self, item):
+        """ Push item onto the latest stack version """
+        self.container = self.container.push(item)
+
+    def pop(self):
+        """ Pop item from the latest stack version """
+        item, self.container = self.container.pop()
+        return item
+
+    def add_back(self, item):
+        """ Add item to the back of the latest deque version """
+        self.container = self.container.add_back(item)
+
+    def remove_front(self):
+        """ Remove item from the front of the latest deque version """
+        item, self.container = self.container.remove_front()
+        return item
+
+    def remove_back(self):
+        """ Remove item from the back of the latest deque version """
+        item, self.container = self.container.remove_back()
+        return item
+
+
+def _persistent_stack():
+    """ Persistent stack driven through its latest version """
+    return _LatestVersion(queue_and_stack.PersistentStack())
+
+
+def _persistent_deque():
+    """ Persistent deque driven through its latest version """
+    return _LatestVersion(queue_and_stack.PersistentDeque())
+
+
+# container name -> order -> (factory, add, remove).  add and remove are method
+# names, or functions that take the container first.
+CONTAINERS = {
+    'LLStack': {
+        'lifo': (queue_and_stack.LLStack, 'push', 'pop'),
+    },
+    'ArrayStack': {
+        'lifo': (queue_and_stack.ArrayStack, 'push', 'pop'),
+    },
+    'TypedArrayStack': {
+        'lifo': (queue_and_stack.TypedArrayStack, 'push', 'pop'),
+    },
+    'StackWithMax': {
+        'lifo': (queue_and_stack.StackWithMax, 'push', 'pop'),
+    },
+    'StackWithMax(compact)': {
+        'lifo': (lambda: queue_and_stack.StackWithMax(compact=True), 'push', 'pop'),
+    },
+    'PersistentStack': {
+        'lifo': (_persistent_stack, 'push', 'pop'),
+    },
+    'QueueWithStacks': {
+        'fifo': (queue_and_stack.QueueWithStacks, 'enqueue', 'dequeue'),
+    },
+    'WindowedAggregateQueue': {
+        'fifo': (queue_and_stack.WindowedAggregateQueue, 'enqueue', 'dequeue'),
+    },
+    'SpillingQueue': {
+        'fifo': (_spilling_queue, 'enqueue', 'dequeue'),
+    },
+    'LLDeque': {
+        'lifo': (queue_and_stack.LLDeque, 'add_back', 'remove_back'),
+        'fifo': (queue_and_stack.LLDeque, 'add_back', 'remove_front'),
+    },
+    'PersistentDeque': {
+        'lifo': (_persistent_deque, 'add_back', 'remove_back'),
+        'fifo': (_persistent_deque, 'add_back', 'remove_front'),
+    },
+    'RandomizedQueue': {
+        'random': (queue_and_stack.RandomizedQueue, 'enqueue', 'dequeue'),
+    },
+    'DaryHeap': {
+        'priority': (queue_and_stack.DaryHeap, 'push', 'pop'),
+    },
+    'IndexedDaryHeap': {
+        'priority': (queue_and_stack.IndexedDaryHeap,
+                     lambda heap, item: heap.push(item, item), 'pop'),
+    },
+    'collections.deque': {
+        'lifo': (collections.deque, 'append', 'pop'),
+        'fifo': (collections.deque, 'append', 'popleft'),
+    },
+    'list': {
+        'lifo': (list, 'append', 'pop'),
+        'fifo': (list, 'append', lambda items: items.pop(0)),
+        'random': (list, 'append', _list_random_pop),
+    },
+    'heapq': {
+        'priority': (list, heapq.heappush, heapq.heappop),
+    },
+}
+
+# order -> container every other container of that order is timed against
+REFERENCES = {
+    'lifo': 'collections.deque',
+    'fifo': 'collections.deque',
+    'random': 'list',
+    'priority': 'heapq',
+}
+
+
+def push_heavy(add, remove, size):
+    """ Push size items.  Returns the number of timed operations. """
+    for item in range(size):
+        add(item)
+    return size
+
+
+def pop_heavy(add, remove, size):
+    """ Pop size items from a container filled before timing starts """
+    for _ in range(size):
+        remove()
+    return size
+
+
+def interleaved(add, remove, size):
+    """ Push two items for every pop until size items have been pushed """
+    for item in range(0, size, 2):
+        add(item)
+        add(item + 1)
+        remove()
+    return size + size // 2
+
+
+def bursty(add, remove, size):
+    """ Fill and drain the container in bursts of BURST_SIZE items """
+    burst = min(BURST_SIZE, size)
+    for _ in range(size // burst):
+        for item in range(burst):
+            add(item)
+        for _ in range(burst):
+            remove()
+    return 2 * burst * (size // burst)
+
+
+def random_dequeue(add, remove, size):
+    """ Alternate enqueues and random dequeues on a container filled before timing
+        starts, so it stays at size items throughout """
+    for item in range(size):
+        add(item)
+        remove()
+    return 2 * size
+
+
+# workload name -> (function, orders it applies to, prefill before timing)
+WORKLOADS = {
+    'push_heavy': (push_heavy, ('lifo', 'fifo', 'random', 'priority'), False),
+    'pop_heavy': (pop_heavy, ('lifo', 'fifo', 'random', 'priority'), True),
+    'interleaved': (interleaved, ('lifo', 'fifo', 'priority'), False),
+    'bursty_fifo': (bursty, ('fifo',), False),
+    'random_dequeue': (random_dequeue, ('random',), True),
+}
+
+
+def _bind(factory, add, remove):
+    """ Internal function to create a container and its add/remove callables """
+    container = factory()
+    if callable(add):
+        add_item = lambda item: add(container, item)
+    else:
+        add_item = getattr(container, add)
+    if callable(remove):
+        return container, add_item, lambda: remove(container)
+    return container, add_item, getattr(container, remove)
+
+
+def _run_once(spec, workload, size, prefill, trace_memory=False):
+    """ Internal function to run one workload on a fresh container.
+        Returns (operations, seconds, peak bytes).  The peak includes the
+        prefill so it reflects the container's own memory. """
+    seed(0)
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+
+    container, add, remove = _bind(*spec)
+    if prefill:
+        for item in range(size):
+            add(item)
+
+    start = time.perf_counter()
+    operations = workload(add, remove, size)
+    seconds = time.perf_counter() - start
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    if hasattr(container, 'close'):
+        container.close()
+    return operations, seconds, peak
+
+
+def _ops_per_sec(spec, workload, size, prefill, min_time):
+    """ Internal function to repeat a workload on fresh containers until it has
+        run for at least min_time seconds.  Returns operations per second. """
+    operations = 0
+    seconds = 0.0
+    while True:
+        run_operations, run_seconds, _ = _run_once(spec, workload, size, prefill)
+        operations += run_operations
+        seconds += run_seconds
+        if seconds >= min_time:
+            break
+    return operations / seconds if seconds else float('inf')
+
+
+def run(sizes, repeats, containers=None, workloads=None, min_time=MIN_TIME,
+        verbose=True):
+    """ Run every matching container/workload/size combination.
+        Returns a list of result dictionaries. """
+    results = []
+    for workload_name, (workload, orders, prefill) in WORKLOADS.items():
+        if workloads and workload_name not in workloads:
+            continue
+        for container_name, specs in CONTAINERS.items():
+            if containers and container_name not in containers:
+                continue
+            for order in orders:
+                if order not in specs:
+                    continue
+                reference = CONTAINERS[REFERENCES[order]][order]
+                for size in sizes:
+                    # time the reference right before each timing, so a slower
+                    # or faster machine moves both and cancels out of the ratio
+                    speeds = []
+                    ratios = []
+                    for _ in range(repeats):
+                        if specs[order] is not reference:
+                            reference_speed = _ops_per_sec(reference, workload, size,
+                                                           prefill, min_time)
+                        speeds.append(_ops_per_sec(specs[order], workload, size,
+                                                   prefill, min_time))
+                        if specs[order] is not reference:
+                            ratios.append(speeds[-1] / reference_speed)
+
+                    # separate run under tracemalloc since tracing slows every
+                    # allocation down
+                    _, _, peak = _run_once(specs[order], workload, size, prefill,
+                                           trace_memory=True)
+                    results.append({
+                        'container': container_name,
+                        'workload': workload_name,
+                        'order': order,
+                        'size': size,
+                        'ops_per_sec': max(speeds),
+                        'relative_speed': statistics.median(ratios) if ratios else 1.0,
+                        'peak_bytes': peak,
+                    })
+                    if verbose:
+                        print('%-24s %-15s %-8s %8d %14.0f ops/s %6.2fx %12d bytes' % (
+                            container_name, workload_name, order, size,
+                            results[-1]['ops_per_sec'], results[-1]['relative_speed'],
+                            peak))
+    return results
+
+
+def _key(result):
+    """ Internal function to identify a result across runs """
+    return result['container'], result['workload'], result['order'], result['size']
+
+
+def environment_mismatch(report, baseline):
+    """ Return the ENVIRONMENT fields that differ between a report and a baseline """
+    return [field for field in ENVIRONMENT if report.get(field) != baseline.get(field)]
+
+
+def compare(results, baseline, tolerance, recheck=None):
+    """ Return a list of messages for results that are slower or use more memory
+        than the baseline by more than tolerance (a fraction).  Speed is compared
+        relative to the reference container, and memory growth must also be at
+        least MIN_PEAK_BYTES to count.  recheck, if given, is called with a
+        result that looks slower and returns a fresh measurement of it; the
+        slowdown only counts if the fresh measurement is slow too. """
+    reference = {_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = reference.get(_key(result))
+        if old is None:
+            continue
+
+        name = '%s %s %s %d' % _key(result)
+        slowest = old['relative_speed'] * (1 - tolerance)
+        if result['relative_speed'] < slowest and recheck is not None:
+            result = dict(recheck(result), peak_bytes=result['peak_bytes'])
+        if result['relative_speed'] < slowest:
+            regressions.append('%s: %.2fx reference speed, baseline %.2fx' % (
+                name, result['relative_speed'], old['relative_speed']))
+        growth = result['peak_bytes'] - old['peak_bytes']
+        if growth > old['peak_bytes'] * tolerance and growth >= MIN_PEAK_BYTES:
+            regressions.append('%s: peak %d bytes, baseline %d bytes' % (
+                name, result['peak_bytes'], old['peak_bytes']))
+    return regressions
+
+
+def main(argv=None):
+    """ Command line entry point.  Returns the process exit code. """
+    parser = argparse.ArgumentParser(description='Benchmark queue_and_stack containers')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=MIN_TIME,
+                        help='minimum seconds each timing runs for')
+    parser.add_argument('--containers', nargs='+', choices=sorted(CONTAINERS))
+    parser.add_argument('--workloads', nargs='+', choices=sorted(WORKLOADS))
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='baseline JSON file to compare against')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='write results to the baseline file instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed fractional slowdown or memory growth')
+    parser.add_argument('--allow-mismatch', action='store_true',
+                        help='compare even if python or platform differ from the baseline')
+    args = parser.parse_args(argv)
+
+    report = {
+        'python': sys.version,
+        'platform': platform.platform(),
+        'results': run(args.sizes, args.repeats, args.containers, args.workloads,
+                       args.min_time),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as output:
+            json.dump(report, output, indent=2)
+        print('Saved baseline to %s' % args.baseline)
+        return 0
+
+    try:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    except FileNotFoundError:
+        print('No baseline at %s, run with --save-baseline to create one' % args.baseline)
+        return 0
+
+    mismatch = environment_mismatch(report, baseline)
+    if mismatch:
+        print('Baseline %s differs from this run in: %s' % (args.baseline,
+                                                            ', '.join(mismatch)))
+        if not args.allow_mismatch:
+            print('Not comparing; use --allow-mismatch to compare anyway')
+            return 2
+
+    def recheck(result):
+        """ Time one suspiciously slow result again before reporting it """
+        rerun = run([result['size']], args.repeats, [result['container']],
+                    [result['workload']], args.min_time, verbose=False)
+        return next(fresh for fresh in rerun if _key(fresh) == _key(result))
+
+    regressions = compare(report['results'], baseline, args.tolerance, recheck)
+    for message in regressions:
+        print('REGRESSION ' + message)
+    if not regressions:
+        print('No regressions against %s' % args.baseline)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
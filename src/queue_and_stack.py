@@ -3,6 +3,12 @@ Created on Feb 19, 2019
 
 @author: Rusty
 '''
+import os
+import pickle
+import tempfile
+import weakref
+from array import array
+from collections import deque
 from random import randint, shuffle
 
 class LLNode:
@@ -32,6 +38,39 @@ class LLStack:
         return self.top is None
 
 
+class PersistentStack:
+    """ Immutable link list stack.  push and pop return a new stack that shares
+        its nodes with the old one, so keeping old versions around is O(1). """
+    def __init__(self, top=None, size=0):
+        self.top = top
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        current_node = self.top
+        while current_node:
+            yield current_node.item
+            current_node = current_node.next
+
+    def push(self, item):
+        """ Return a new stack with item on top """
+        return PersistentStack(LLNode(item, self.top), self.size + 1)
+
+    def pop(self):
+        """ Return the top item and a new stack without it """
+        return self.top.item, PersistentStack(self.top.next, self.size - 1)
+
+    def peek(self):
+        """ Return value at top of stack """
+        return self.top.item
+
+    def empty(self):
+        """ Return if no more items in stack """
+        return self.top is None
+
+
 class ArrayStack:
     """ Array stack implementation """
     def __init__(self):
@@ -54,6 +93,83 @@ class ArrayStack:
         return self.items[-1]
 
 
+class TypedArrayStack:
+    """ Array stack of machine numbers backed by array.array.  typecode is any
+        array module typecode, e.g. 'q' for 64 bit ints or 'd' for doubles. """
+    def __init__(self, typecode='q', items=()):
+        self.items = array(typecode)
+        self.extend(items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def push(self, item):
+        """ Push item onto stack """
+        self.items.append(item)
+
+    def pop(self):
+        """ Pop item from top of stack """
+        return self.items.pop()
+
+    def empty(self):
+        """ Return if no more items in stack """
+        return not self.items
+
+    def peek(self):
+        """ Return value at top of stack without altering stack state"""
+        return self.items[-1]
+
+    def extend(self, items):
+        """ Push all items onto stack in order.  Contiguous buffers of the same
+            number kind and size (array.array, NumPy arrays) are copied in bulk.
+            Buffers with more than one dimension are rejected; flatten them first. """
+        try:
+            view = memoryview(items)
+        except TypeError:
+            self.items.extend(items)
+            return
+
+        if view.ndim > 1:
+            raise ValueError('cannot extend from a %d dimensional buffer' % view.ndim)
+        if view.c_contiguous and _same_number_type(view, self.items):
+            self.items.frombytes(view.cast('B'))
+        else:
+            self.items.extend(view.tolist() if view.ndim else [view.tolist()])
+
+    def view(self):
+        """ Return a zero copy memoryview of the stack, bottom item first.
+            The stack cannot grow or shrink while the view is alive; release it
+            (or use it in a with block) before pushing or popping again. """
+        return memoryview(self.items)
+
+    def as_numpy(self):
+        """ Return a zero copy NumPy array of the stack, bottom item first.
+            The same resizing restriction as view applies.  Only number
+            typecodes are supported, not the 'u'/'w' character typecodes. """
+        if self.items.typecode not in 'bBhHiIlLqQfd':
+            raise ValueError('NumPy has no dtype for typecode %r' % self.items.typecode)
+
+        import numpy
+        return numpy.frombuffer(self.items, dtype=self.items.typecode)
+
+
+def _same_number_type(view, items):
+    """ Internal function to check if a buffer holds the same kind of number as
+        an array, so its raw bytes can be copied directly """
+    def kind(code):
+        if code in 'fd':
+            return 'float'
+        if code in 'bhilqn':
+            return 'signed'
+        if code in 'BHILQN':
+            return 'unsigned'
+        return code
+
+    code = view.format.lstrip('@')
+    return (len(code) == 1 and view.itemsize == items.itemsize
+            and kind(code) == kind(items.typecode))
+
+
 class QueueWithStacks:
     """ Array stack implementation """
     def __init__(self):
@@ -76,28 +192,233 @@ class QueueWithStacks:
         """ Return if no more items in stack """
         return self.inbox.empty() and self.outbox.empty()
 
+class SpillingQueue:
+    """ FIFO queue that keeps at most memory_budget items in memory.  Past the
+        budget the middle of the backlog is written to append-only segment files
+        of segment_size items, while the head and tail stay in memory.  Segments
+        are read back with one sequential read each and deleted once drained.
+        Use as a context manager or call close to delete remaining segments. """
+    def __init__(self, memory_budget=100000, segment_size=None, directory=None):
+        if memory_budget < 2:
+            raise ValueError('memory_budget must be at least 2')
+        segment_size = segment_size or memory_budget // 2
+        if not 0 < segment_size <= memory_budget // 2:
+            raise ValueError('segment_size must be between 1 and half of memory_budget')
+
+        self.memory_budget = memory_budget
+        self.segment_size = segment_size
+        self.head = deque()
+        self.tail = []
+        self.segments = deque()
+        self.closed = False
+        self._spilled = 0
+        if directory is None:
+            self.directory = tempfile.mkdtemp(prefix='queue_')
+            owned_directory = self.directory
+        else:
+            self.directory = directory
+            owned_directory = None
+        # cleans up segment files even if close is never called
+        self._finalizer = weakref.finalize(self, _remove_segments, self.segments,
+                                           owned_directory)
+
+    def __len__(self):
+        return len(self.head) + self._spilled + len(self.tail)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def enqueue(self, item):
+        """ Add an item to the back of the queue """
+        self._check_open()
+        self.tail.append(item)
+        while self._over_budget():
+            self._spill()
+
+    def dequeue(self):
+        """ Remove an item from the front of the queue """
+        self._check_open()
+        if not self.head:
+            if self.segments:
+                self._load()
+            else:
+                self.head = deque(self.tail[:self.segment_size])
+                del self.tail[:self.segment_size]
+
+        return self.head.popleft()
+
+    def empty(self):
+        """ Return if no more items in queue """
+        return not self.head and not self.segments and not self.tail
+
+    def close(self):
+        """ Delete any remaining segment files.  The queue is empty and can no
+            longer be used afterwards. """
+        self._finalizer()
+        self.closed = True
+        self.head.clear()
+        self.tail = []
+        self._spilled = 0
+
+    def _check_open(self):
+        """ Internal function to fail clearly when the queue has been closed """
+        if self.closed:
+            raise ValueError('queue is closed')
+
+    def _over_budget(self):
+        """ Internal function to check if the tail must be spilled.  The head never
+            holds more than segment_size items, so the tail always has at least
+            segment_size items when this is true. """
+        if self.segments:
+            # leave room to load the next segment once the head runs out
+            return len(self.tail) > self.memory_budget - self.segment_size
+        return len(self.head) + len(self.tail) > self.memory_budget
+
+    def _spill(self):
+        """ Internal function to write the oldest tail items to a new segment file.
+            File names are unique, so queues can share a directory. """
+        handle, path = tempfile.mkstemp(suffix='.seg', prefix='segment_',
+                                        dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as segment:
+                pickle.dump(self.tail[:self.segment_size], segment, pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            # the items are still in the tail, so only the partial file goes
+            os.remove(path)
+            raise
+
+        self.segments.append(path)
+        self._spilled += self.segment_size
+        del self.tail[:self.segment_size]
+
+    def _load(self):
+        """ Internal function to read the oldest segment file into the head buffer """
+        path = self.segments.popleft()
+        with open(path, 'rb') as segment:
+            self.head = deque(pickle.loads(segment.read()))
+
+        os.remove(path)
+        self._spilled -= len(self.head)
+
+
+def _remove_segments(segments, directory):
+    """ Internal function to delete segment files and the queue's own directory """
+    while segments:
+        os.remove(segments.popleft())
+    if directory is not None:
+        os.rmdir(directory)
+
+
 class StackWithMax(ArrayStack):
-    """ Stack class with max function to return the current max """
-    def __init__(self):
+    """ Stack class with max function to return the current max.
+        In compact mode the max stack only records new maxima, as (index, item)
+        pairs, instead of a copy of the current max on every push. """
+    def __init__(self, compact=False):
         super().__init__()
+        self.compact = compact
         self.max_stack = ArrayStack()
 
     def max(self):
         """ Return maximum value in the stack """
+        if self.compact:
+            return self.max_stack.peek()[1]
         return self.max_stack.peek()
 
     def push(self, item):
         """ Push item onto stack """
         super().push(item)
-        if self.max_stack.empty() or item > self.max():
+        if self.compact:
+            if self.max_stack.empty() or item > self.max():
+                self.max_stack.push((len(self.items) - 1, item))
+        elif self.max_stack.empty() or item > self.max():
             self.max_stack.push(item)
         else:
             self.max_stack.push(self.max())
 
     def pop(self):
         """ Pop item from top of stack """
-        self.max_stack.pop()
-        return super().pop()
+        item = super().pop()
+        # a compact record is dropped by position.  Matching by value would
+        # never drop a NaN
+        if not self.compact or self.max_stack.peek()[0] == len(self.items):
+            self.max_stack.pop()
+        return item
+
+
+class WindowedAggregateQueue:
+    """ FIFO queue with max and min functions to return the current max and min.
+        Uses monotonic deques so every operation is O(1) amortized. """
+    def __init__(self):
+        self.items = deque()
+        # candidates are stored as (position, item) so dequeue can drop them by
+        # position.  Matching by value would never drop a NaN.
+        self.max_deque = deque()
+        self.min_deque = deque()
+        self._enqueued = 0
+        self._dequeued = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def enqueue(self, item):
+        """ Add an item to the back of the queue """
+        self.items.append(item)
+
+        # drop candidates that can never be the max/min again
+        while self.max_deque and self.max_deque[-1][1] <= item:
+            self.max_deque.pop()
+        self.max_deque.append((self._enqueued, item))
+
+        while self.min_deque and self.min_deque[-1][1] >= item:
+            self.min_deque.pop()
+        self.min_deque.append((self._enqueued, item))
+        self._enqueued += 1
+
+    def dequeue(self):
+        """ Remove an item from the front of the queue """
+        item = self.items.popleft()
+        if self.max_deque[0][0] == self._dequeued:
+            self.max_deque.popleft()
+        if self.min_deque[0][0] == self._dequeued:
+            self.min_deque.popleft()
+        self._dequeued += 1
+        return item
+
+    def empty(self):
+        """ Return if no more items in queue """
+        return not self.items
+
+    def max(self):
+        """ Return maximum value in the queue """
+        return self.max_deque[0][1]
+
+    def min(self):
+        """ Return minimum value in the queue """
+        return self.min_deque[0][1]
+
+
+def windowed_max_min(values, window):
+    """ Return an iterator of (max, min) tuples for every full window of the given
+        size over values.  values can be any iterable, including a NumPy array. """
+    if window < 1:
+        raise ValueError('window must be at least 1')
+
+    return _windowed_max_min(values, window)
+
+
+def _windowed_max_min(values, window):
+    """ Internal generator for windowed_max_min, so the window check runs
+        before iteration starts """
+    queue = WindowedAggregateQueue()
+    for item in values:
+        queue.enqueue(item)
+        if len(queue) > window:
+            queue.dequeue()
+        if len(queue) == window:
+            yield queue.max(), queue.min()
 
 
 class DLLNode:
@@ -162,6 +483,158 @@ class LLDeque:
         return item
 
 
+class _Stream:
+    """ Lazy singly linked list cell.  Forcing runs the suspended computation at
+        most once and returns None for an empty stream or an (item, rest) pair.
+        Every version holding the cell shares the memoized result. """
+    __slots__ = ('_suspension', '_value')
+
+    def __init__(self, suspension=None, value=None):
+        self._suspension = suspension
+        self._value = value
+
+    def force(self):
+        """ Return None or an (item, rest) pair, computing it on first use """
+        if self._suspension is not None:
+            self._value = self._suspension()
+            self._suspension = None
+        return self._value
+
+
+_EMPTY_STREAM = _Stream()
+
+
+def _stream_append(first, second):
+    """ Internal function to lazily append two streams, one cell at a time """
+    def suspension():
+        cell = first.force()
+        if cell is None:
+            return second.force()
+        return cell[0], _stream_append(cell[1], second)
+    return _Stream(suspension)
+
+
+def _stream_take(count, stream):
+    """ Internal function to lazily take the first count items, one cell at a time """
+    def suspension():
+        cell = stream.force() if count else None
+        if cell is None:
+            return None
+        return cell[0], _stream_take(count - 1, cell[1])
+    return _Stream(suspension)
+
+
+def _stream_reverse_drop(count, stream):
+    """ Internal function to lazily reverse the stream after its first count
+        items.  The whole result is built the first time it is forced. """
+    def suspension():
+        rest = stream
+        for _ in range(count):
+            rest = rest.force()[1]
+        reversed_ = _EMPTY_STREAM
+        cell = rest.force()
+        while cell is not None:
+            reversed_ = _Stream(value=(cell[0], reversed_))
+            cell = cell[1].force()
+        return reversed_.force()
+    return _Stream(suspension)
+
+
+class PersistentDeque:
+    """ Immutable banker's deque.  Every operation returns a new deque that
+        shares structure with the old one.  The front and back are lazy streams
+        kept within a factor of BALANCE of each other.  When an operation would
+        break that, half of the longer side is moved to the other through lazy
+        suspensions.  The suspensions are shared by every version derived from
+        that deque, so each is paid for once, keeping both ends amortized O(1)
+        even when many versions are kept and branched from. """
+    BALANCE = 3
+
+    def __init__(self, front=_EMPTY_STREAM, front_size=0, back=_EMPTY_STREAM,
+                 back_size=0):
+        self.front = front
+        self.front_size = front_size
+        self.back = back
+        self.back_size = back_size
+
+    def __len__(self):
+        return self.front_size + self.back_size
+
+    def __iter__(self):
+        cell = self.front.force()
+        while cell is not None:
+            yield cell[0]
+            cell = cell[1].force()
+
+        back = []
+        cell = self.back.force()
+        while cell is not None:
+            back.append(cell[0])
+            cell = cell[1].force()
+        yield from reversed(back)
+
+    def empty(self):
+        """ If no items in container """
+        return not self.front_size and not self.back_size
+
+    def add_front(self, item):
+        """ Return a new deque with item added to the front """
+        return self._balanced(_Stream(value=(item, self.front)), self.front_size + 1,
+                              self.back, self.back_size)
+
+    def add_back(self, item):
+        """ Return a new deque with item added to the back """
+        return self._balanced(self.front, self.front_size,
+                              _Stream(value=(item, self.back)), self.back_size + 1)
+
+    def peek_front(self):
+        """ Return item at the front of container """
+        # the balance rule means an empty front leaves at most one item at the back
+        return self._end(self.front, self.front_size, self.back)[0]
+
+    def peek_back(self):
+        """ Return item at the back of container """
+        return self._end(self.back, self.back_size, self.front)[0]
+
+    def remove_front(self):
+        """ Return the front item and a new deque without it """
+        item, rest = self._end(self.front, self.front_size, self.back)
+        if not self.front_size:
+            return item, PersistentDeque()
+        return item, self._balanced(rest, self.front_size - 1, self.back, self.back_size)
+
+    def remove_back(self):
+        """ Return the back item and a new deque without it """
+        item, rest = self._end(self.back, self.back_size, self.front)
+        if not self.back_size:
+            return item, PersistentDeque()
+        return item, self._balanced(self.front, self.front_size, rest, self.back_size - 1)
+
+    @staticmethod
+    def _end(side, side_size, other):
+        """ Internal function to return the first (item, rest) cell of side, or
+            of the other side when side is empty """
+        cell = (side if side_size else other).force()
+        if cell is None:
+            raise IndexError('remove from an empty deque')
+        return cell
+
+    @classmethod
+    def _balanced(cls, front, front_size, back, back_size):
+        """ Internal function to build a deque, moving half of the longer side to
+            the shorter one if they are too far apart """
+        size = front_size + back_size
+        if front_size > cls.BALANCE * back_size + 1:
+            keep = size // 2
+            back = _stream_append(back, _stream_reverse_drop(keep, front))
+            return cls(_stream_take(keep, front), keep, back, size - keep)
+        if back_size > cls.BALANCE * front_size + 1:
+            keep = size // 2
+            front = _stream_append(front, _stream_reverse_drop(keep, back))
+            return cls(front, size - keep, _stream_take(keep, back), keep)
+        return cls(front, front_size, back, back_size)
+
+
 class RandomizedQueue:
     """ Queue that returns an element at a random position """
     def __init__(self):
@@ -196,5 +669,230 @@ class RandomizedQueue:
         return not self.items
 
 
+class DaryHeap:
+    """ Min priority queue stored as a d-ary heap in a list.  A larger branching
+        factor d makes the heap shallower, so fewer cache lines are touched. """
+    def __init__(self, items=(), d=4):
+        if d < 2:
+            raise ValueError('d must be at least 2')
+
+        self.d = d
+        self.items = list(items)
+        self.heapify()
+
+    def __len__(self):
+        return len(self.items)
+
+    def heapify(self):
+        """ Restore heap order over all items in O(n) """
+        for index in reversed(range((len(self.items) - 2) // self.d + 1)):
+            self._sift_down(index)
+
+    def push(self, item):
+        """ Add an item to the queue """
+        self.items.append(item)
+        self._sift_up(len(self.items) - 1)
+
+    def pop(self):
+        """ Remove and return the smallest item """
+        last = self.items.pop()
+        if not self.items:
+            return last
+
+        item = self.items[0]
+        self.items[0] = last
+        self._sift_down(0)
+        return item
+
+    def pop_many(self, count):
+        """ Remove and return up to count smallest items in order """
+        return [self.pop() for _ in range(min(count, len(self.items)))]
+
+    def peek(self):
+        """ Return smallest item without altering queue state """
+        return self.items[0]
+
+    def empty(self):
+        """ Return if no more items in queue """
+        return not self.items
+
+    def _sift_up(self, index):
+        """ Internal function to move an item up until its parent is not larger """
+        items = self.items
+        item = items[index]
+        while index > 0:
+            parent = (index - 1) // self.d
+            if not item < items[parent]:
+                break
+            items[index] = items[parent]
+            index = parent
+        items[index] = item
+
+    def _sift_down(self, index):
+        """ Internal function to move an item down until no child is smaller """
+        items = self.items
+        size = len(items)
+        item = items[index]
+        while True:
+            first = index * self.d + 1
+            if first >= size:
+                break
+            child = min(range(first, min(first + self.d, size)), key=items.__getitem__)
+            if not items[child] < item:
+                break
+            items[index] = items[child]
+            index = child
+        items[index] = item
+
+
+class IndexedDaryHeap:
+    """ Min priority queue of (item, priority) pairs stored as a d-ary heap.
+        push returns a handle that can later be used to look up, decrease or
+        remove that entry in O(log n).  Handles are never reused, but the
+        storage slots behind them are. """
+    def __init__(self, pairs=(), d=4):
+        if d < 2:
+            raise ValueError('d must be at least 2')
+
+        self.d = d
+        # per slot storage.  The heap holds slots, and handles map to slots
+        self.items = []
+        self.priorities = []
+        self.positions = []
+        self.heap = []
+        self._handles = []
+        self._slots = {}
+        self._free = []
+        self._next_handle = 0
+        for item, priority in pairs:
+            self._new_entry(item, priority)
+        self.heapify()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, handle):
+        return handle in self._slots
+
+    def heapify(self):
+        """ Restore heap order over all entries in O(n) """
+        for index in reversed(range((len(self.heap) - 2) // self.d + 1)):
+            self._sift_down(index)
+
+    def push(self, item, priority):
+        """ Add an item with the given priority.  Returns its handle. """
+        handle = self._new_entry(item, priority)
+        self._sift_up(len(self.heap) - 1)
+        return handle
+
+    def pop(self):
+        """ Remove and return the item with the smallest priority """
+        return self._remove_at(0)
+
+    def pop_many(self, count):
+        """ Remove and return up to count items in priority order """
+        return [self.pop() for _ in range(min(count, len(self.heap)))]
+
+    def peek(self):
+        """ Return item with the smallest priority without altering queue state """
+        return self.items[self.heap[0]]
+
+    def empty(self):
+        """ Return if no more items in queue """
+        return not self.heap
+
+    def priority(self, handle):
+        """ Return the priority of the entry with the given handle """
+        return self.priorities[self._slots[handle]]
+
+    def decrease_key(self, handle, priority):
+        """ Lower the priority of the entry with the given handle """
+        slot = self._slots[handle]
+        if self.priorities[slot] < priority:
+            raise ValueError('new priority is larger than the current priority')
+
+        self.priorities[slot] = priority
+        self._sift_up(self.positions[slot])
+
+    def remove(self, handle):
+        """ Remove the entry with the given handle and return its item """
+        return self._remove_at(self.positions[self._slots[handle]])
+
+    def _new_entry(self, item, priority):
+        """ Internal function to store an entry at the end of the heap, reusing a
+            free slot if possible.  Returns a new handle for it. """
+        handle = self._next_handle
+        self._next_handle += 1
+        if self._free:
+            slot = self._free.pop()
+            self.items[slot] = item
+            self.priorities[slot] = priority
+            self._handles[slot] = handle
+        else:
+            slot = len(self.items)
+            self.items.append(item)
+            self.priorities.append(priority)
+            self.positions.append(-1)
+            self._handles.append(handle)
+
+        self._slots[handle] = slot
+        self.heap.append(slot)
+        self.positions[slot] = len(self.heap) - 1
+        return handle
+
+    def _remove_at(self, index):
+        """ Internal function to remove the entry at a heap index """
+        slot = self.heap[index]
+        last = self.heap.pop()
+        if index < len(self.heap):
+            self.heap[index] = last
+            self.positions[last] = index
+            self._sift_up(index)
+            self._sift_down(self.positions[last])
+
+        item = self.items[slot]
+        del self._slots[self._handles[slot]]
+        self.items[slot] = None
+        self.priorities[slot] = None
+        self.positions[slot] = -1
+        self._free.append(slot)
+        return item
+
+    def _sift_up(self, index):
+        """ Internal function to move an entry up until its parent is not larger """
+        heap, priorities, positions = self.heap, self.priorities, self.positions
+        slot = heap[index]
+        priority = priorities[slot]
+        while index > 0:
+            parent = (index - 1) // self.d
+            if not priority < priorities[heap[parent]]:
+                break
+            heap[index] = heap[parent]
+            positions[heap[index]] = index
+            index = parent
+        heap[index] = slot
+        positions[slot] = index
+
+    def _sift_down(self, index):
+        """ Internal function to move an entry down until no child is smaller """
+        heap, priorities, positions = self.heap, self.priorities, self.positions
+        size = len(heap)
+        slot = heap[index]
+        priority = priorities[slot]
+        while True:
+            first = index * self.d + 1
+            if first >= size:
+                break
+            child = min(range(first, min(first + self.d, size)),
+                        key=lambda position: priorities[heap[position]])
+            if not priorities[heap[child]] < priority:
+                break
+            heap[index] = heap[child]
+            positions[heap[index]] = index
+            index = child
+        heap[index] = slot
+        positions[slot] = index
+
+
 if __name__ == '__main__':
     print('Hello')
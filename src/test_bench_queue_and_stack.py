@@ -0,0 +1,69 @@
+'''
+Created on Oct 19, 2026
+
+@author: Rusty
+'''
+
+import unittest
+
+import bench_queue_and_stack
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    """ Tests for the queue and stack benchmark harness """
+    @classmethod
+    def setUpClass(cls):
+        """ Run the harness once at a tiny size for all tests """
+        unittest.TestCase.setUpClass()
+        cls.results = bench_queue_and_stack.run([10], 1, min_time=0, verbose=False)
+
+    def test_every_container_runs(self):
+        """ Every container should have at least one result """
+        containers = {result['container'] for result in self.results}
+        self.assertEqual(set(bench_queue_and_stack.CONTAINERS), containers)
+        for result in self.results:
+            self.assertGreater(result['ops_per_sec'], 0)
+            self.assertGreater(result['relative_speed'], 0)
+            self.assertGreater(result['peak_bytes'], 0)
+
+    def test_references_are_one(self):
+        """ Reference containers should have a relative speed of exactly one """
+        for result in self.results:
+            if result['container'] == bench_queue_and_stack.REFERENCES[result['order']]:
+                self.assertEqual(1.0, result['relative_speed'])
+
+    def test_compare_same_results(self):
+        """ Results should not regress against themselves """
+        self.assertEqual([], bench_queue_and_stack.compare(
+            self.results, {'results': self.results}, 0.25))
+
+    def test_compare_regressions(self):
+        """ Slower or larger results should be flagged, small memory noise should not """
+        baseline = dict(self.results[0], relative_speed=1.0, peak_bytes=0)
+        slower = dict(baseline, relative_speed=0.5)
+        noise = dict(baseline, peak_bytes=100)
+        larger = dict(baseline, peak_bytes=100000)
+
+        for result, count in [(slower, 1), (noise, 0), (larger, 1)]:
+            self.assertEqual(count, len(bench_queue_and_stack.compare(
+                [result], {'results': [baseline]}, 0.25)))
+
+    def test_compare_recheck(self):
+        """ A slowdown should only count if the recheck is slow too """
+        baseline = dict(self.results[0], relative_speed=1.0)
+        slower = dict(baseline, relative_speed=0.5)
+
+        for fresh_speed, count in [(1.0, 0), (0.5, 1)]:
+            recheck = lambda result: dict(result, relative_speed=fresh_speed)
+            self.assertEqual(count, len(bench_queue_and_stack.compare(
+                [slower], {'results': [baseline]}, 0.25, recheck)))
+
+    def test_environment_mismatch(self):
+        """ Differing python or platform fields should be reported """
+        report = {'python': '3.7', 'platform': 'linux', 'results': []}
+        self.assertEqual([], bench_queue_and_stack.environment_mismatch(report, report))
+        self.assertEqual(['python'], bench_queue_and_stack.environment_mismatch(
+            report, dict(report, python='3.12')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,10 +4,21 @@ Created on Feb 19, 2019
 @author: Rusty
 '''
 
+import os
+import pickle
+import tempfile
 import unittest
+from array import array
+from collections import deque
+from random import Random
 
 import queue_and_stack
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class CommonTests:
     """ Common tests for all stack implementations """
@@ -74,6 +85,36 @@ class StackLLTestCase(unittest.TestCase, CommonTests):
                            '12345')
         self._test_strings(queue_and_stack.LLStack(), queue_and_stack.LLStack(), '')
 
+class PersistentStackTestCase(unittest.TestCase):
+    """ Tests for persistent stacks """
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.stack = queue_and_stack.PersistentStack()
+
+    def test_empty_is_empty(self):
+        """ Stack should start out emtpy """
+        self.assertTrue(self.stack.empty())
+        self.assertEqual(0, len(self.stack))
+
+    def test_pop_empty(self):
+        """ popping an empty linked list give a none type error """
+        with self.assertRaises(AttributeError):
+            self.stack.pop()
+
+    def test_old_versions_unchanged(self):
+        """ push and pop should leave earlier versions intact """
+        first = self.stack.push('a')
+        second = first.push('b')
+        item, third = second.pop()
+
+        self.assertEqual('b', item)
+        self.assertTrue(self.stack.empty())
+        self.assertEqual(['a'], list(first))
+        self.assertEqual(['b', 'a'], list(second))
+        self.assertEqual(['a'], list(third))
+        self.assertIs(first.top, third.top)
+
+
 class StackArrayTestCase(unittest.TestCase, CommonTests):
     """ Tests for stacks """
     def setUp(self):
@@ -96,6 +137,84 @@ class StackArrayTestCase(unittest.TestCase, CommonTests):
                            '')
 
 
+class TypedArrayStackTestCase(unittest.TestCase):
+    """ Tests for typed array stacks """
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.stack = queue_and_stack.TypedArrayStack('q')
+
+    def test_empty_is_empty(self):
+        """ Stack should start out emtpy """
+        self.assertTrue(self.stack.empty())
+
+    def test_pop_empty(self):
+        """ popping an empty array gives an index error """
+        with self.assertRaises(IndexError):
+            self.stack.pop()
+
+    def test_reverse_order_pop(self):
+        """ Two pushes should reverse order when popped """
+        self.stack.push(1)
+        self.stack.push(2)
+        self.assertEqual(2, self.stack.peek())
+        self.assertEqual(2, self.stack.pop())
+        self.assertEqual(1, self.stack.pop())
+        self.assertTrue(self.stack.empty())
+
+    def test_push_wrong_type(self):
+        """ Only numbers of the stack's type can be pushed """
+        with self.assertRaises(TypeError):
+            self.stack.push('a')
+
+    def test_extend(self):
+        """ Bulk extend from buffers and iterables keeps order """
+        self.stack.extend(array('q', [1, 2, 3]))
+        self.stack.extend(array('i', [4, 5]))
+        self.stack.extend(range(6, 8))
+        self.assertEqual(list(range(1, 8)), self.stack.view().tolist())
+        self.assertEqual(7, self.stack.pop())
+
+    def test_extend_float_buffer(self):
+        """ Buffers of a different number kind are converted, not reinterpreted """
+        stack = queue_and_stack.TypedArrayStack('d')
+        stack.extend(array('q', [1, 2]))
+        self.assertEqual([1.0, 2.0], stack.view().tolist())
+
+    def test_extend_multi_dimensional(self):
+        """ Buffers with more than one dimension should be rejected for any kind """
+        buffer = memoryview(array('q', range(6))).cast('B').cast('q', [2, 3])
+        with self.assertRaises(ValueError):
+            self.stack.extend(buffer)
+        with self.assertRaises(ValueError):
+            queue_and_stack.TypedArrayStack('d').extend(buffer)
+        self.assertTrue(self.stack.empty())
+
+    def test_view_is_zero_copy(self):
+        """ Writes through the view should be seen by the stack """
+        self.stack.extend([1, 2, 3])
+        with self.stack.view() as view:
+            view[0] = 10
+        self.assertEqual(10, self.stack.items[0])
+        self.stack.push(4)
+        self.assertEqual(4, len(self.stack))
+
+    def test_as_numpy_character_typecode(self):
+        """ Character typecodes have no NumPy dtype and should be rejected """
+        with self.assertRaises(ValueError):
+            queue_and_stack.TypedArrayStack('u').as_numpy()
+
+    @unittest.skipUnless(numpy, 'numpy is not installed')
+    def test_as_numpy_is_zero_copy(self):
+        """ NumPy view should have the stack's dtype and share its memory """
+        for typecode in 'bBhHiIlLqQfd':
+            stack = queue_and_stack.TypedArrayStack(typecode, [1, 2, 3])
+            values = stack.as_numpy()
+            self.assertEqual(stack.items.itemsize, values.itemsize)
+            self.assertEqual([1, 2, 3], values.tolist())
+            values[0] = 10
+            self.assertEqual(10, stack.items[0])
+
+
 class StackWithMaxTestCase(unittest.TestCase, CommonTests):
     """ Tests for stacks """
     def setUp(self):
@@ -136,6 +255,89 @@ class StackWithMaxTestCase(unittest.TestCase, CommonTests):
             maxes.pop()
 
 
+class CompactStackWithMaxTestCase(StackWithMaxTestCase):
+    """ Tests for stacks with max in compact mode """
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.stack = queue_and_stack.StackWithMax(compact=True)
+
+    def test_compact_storage(self):
+        """ Only new maxima should be stored on the max stack """
+        for item in [5, 1, 2, 3, 4]:
+            self.stack.push(item)
+        self.assertEqual([(0, 5)], self.stack.max_stack.items)
+
+    def test_duplicate_max(self):
+        """ Popping one copy of a duplicate max should keep the max """
+        for item in [1, 7, 3, 7]:
+            self.stack.push(item)
+        self.stack.pop()
+        self.assertEqual(7, self.stack.max())
+        self.stack.pop()
+        self.assertEqual(7, self.stack.max())
+        self.stack.pop()
+        self.assertEqual(1, self.stack.max())
+
+    def test_nan_max(self):
+        """ A NaN max should be dropped once it is popped """
+        for item in [float('nan'), 5]:
+            self.stack.push(item)
+        self.stack.pop()
+        self.stack.pop()
+        self.stack.push(3)
+        self.assertEqual(3, self.stack.max())
+        self.assertEqual([(0, 3)], self.stack.max_stack.items)
+
+
+class WindowedAggregateQueueTestCase(unittest.TestCase):
+    """ Tests for queues with max and min """
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.queue = queue_and_stack.WindowedAggregateQueue()
+
+    def test_empty_is_empty(self):
+        """ Queue should start out emtpy """
+        self.assertTrue(self.queue.empty())
+
+    def test_dequeue_empty(self):
+        """ popping an empty queue gives an index error """
+        with self.assertRaises(IndexError):
+            self.queue.dequeue()
+
+    def test_max_min(self):
+        """ max and min should follow the items currently in the queue """
+        reference = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5]
+        for item in reference:
+            self.queue.enqueue(item)
+
+        for index, item in enumerate(reference):
+            self.assertEqual(max(reference[index:]), self.queue.max())
+            self.assertEqual(min(reference[index:]), self.queue.min())
+            self.assertEqual(item, self.queue.dequeue())
+        self.assertTrue(self.queue.empty())
+
+    def test_windowed_max_min(self):
+        """ Streaming helper should match a brute force window scan """
+        reference = [129, 277, -93, 874, 874, 9115, -8766, 8998, 5549, 10]
+        window = 3
+        expected = [(max(reference[i:i + window]), min(reference[i:i + window]))
+                    for i in range(len(reference) - window + 1)]
+        self.assertEqual(expected,
+                         list(queue_and_stack.windowed_max_min(reference, window)))
+        self.assertEqual([], list(queue_and_stack.windowed_max_min([1, 2], window)))
+
+    def test_windowed_max_min_bad_window(self):
+        """ A window below 1 should fail when called, not when iterated """
+        with self.assertRaises(ValueError):
+            queue_and_stack.windowed_max_min([1, 2], 0)
+
+    def test_nan_leaves_window(self):
+        """ A NaN should stop affecting the result once it leaves the window """
+        nan = float('nan')
+        result = list(queue_and_stack.windowed_max_min([1.0, nan, 2.0, 3.0, 0.5, 0.1], 2))
+        self.assertEqual([(3.0, 2.0), (3.0, 0.5), (0.5, 0.1)], result[2:])
+
+
 class QueueTestCase(unittest.TestCase):
     """ Tests for queues """
     def setUp(self):
@@ -185,6 +387,118 @@ class QueueTestCase(unittest.TestCase):
               '')
 
 
+class SpillingQueueTestCase(QueueTestCase):
+    """ Tests for queues that spill to disk """
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.queue = queue_and_stack.SpillingQueue(memory_budget=4)
+        self.addCleanup(self.queue.close)
+
+    def test_spill_keeps_order(self):
+        """ Items spilled to disk should come back in original order """
+        reference = list(range(50))
+        for item in reference[:30]:
+            self.queue.enqueue(item)
+        self.assertTrue(self.queue.segments)
+        self.assertLessEqual(len(self.queue.head) + len(self.queue.tail), 4)
+
+        test = [self.queue.dequeue() for _ in range(10)]
+        for item in reference[30:]:
+            self.queue.enqueue(item)
+        while not self.queue.empty():
+            test.append(self.queue.dequeue())
+
+        self.assertEqual(reference, test)
+        self.assertEqual(0, len(self.queue))
+
+    def test_memory_budget(self):
+        """ Items in memory should never exceed the budget """
+        random = Random(3)
+        queue = queue_and_stack.SpillingQueue(memory_budget=10, segment_size=3)
+        self.addCleanup(queue.close)
+        model = deque()
+        for item in range(2000):
+            if random.random() < 0.6:
+                queue.enqueue(item)
+                model.append(item)
+            elif model:
+                self.assertEqual(model.popleft(), queue.dequeue())
+            self.assertLessEqual(len(queue.head) + len(queue.tail), 10)
+            self.assertEqual(len(model), len(queue))
+
+    def test_segment_size_too_large(self):
+        """ Segments larger than half the budget would break the memory cap """
+        with self.assertRaises(ValueError):
+            queue_and_stack.SpillingQueue(memory_budget=10, segment_size=1000)
+
+    def test_use_after_close(self):
+        """ A closed queue should refuse further use """
+        self.queue.close()
+        with self.assertRaises(ValueError):
+            self.queue.enqueue('a')
+        with self.assertRaises(ValueError):
+            self.queue.dequeue()
+
+    def test_context_manager(self):
+        """ Leaving a with block should delete segments and the directory """
+        with queue_and_stack.SpillingQueue(memory_budget=4) as queue:
+            for item in range(20):
+                queue.enqueue(item)
+            paths = list(queue.segments)
+        self.assertTrue(paths)
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        self.assertFalse(os.path.exists(queue.directory))
+
+    def test_shared_directory(self):
+        """ Queues sharing a directory should not overwrite each other's segments """
+        with tempfile.TemporaryDirectory() as directory:
+            with queue_and_stack.SpillingQueue(4, directory=directory) as first, \
+                    queue_and_stack.SpillingQueue(4, directory=directory) as second:
+                for item in range(20):
+                    first.enqueue(('a', item))
+                    second.enqueue(('b', item))
+
+                self.assertEqual([('a', item) for item in range(20)],
+                                 [first.dequeue() for _ in range(20)])
+                self.assertEqual([('b', item) for item in range(20)],
+                                 [second.dequeue() for _ in range(20)])
+            self.assertEqual([], os.listdir(directory))
+
+    def test_spill_failure(self):
+        """ An item that cannot be pickled should not leave a partial segment """
+        self.queue.enqueue(lambda: None)
+        with self.assertRaises((pickle.PicklingError, AttributeError, TypeError)):
+            for item in range(4):
+                self.queue.enqueue(item)
+        self.assertEqual([], os.listdir(self.queue.directory))
+
+        self.queue.close()
+        self.assertFalse(os.path.exists(self.queue.directory))
+
+    def test_garbage_collected(self):
+        """ Segments should be deleted even if close is never called """
+        queue = queue_and_stack.SpillingQueue(memory_budget=4)
+        for item in range(20):
+            queue.enqueue(item)
+        directory = queue.directory
+        del queue
+        self.assertFalse(os.path.exists(directory))
+
+    def test_segments_deleted(self):
+        """ Segment files should be removed once drained or closed """
+        for item in range(20):
+            self.queue.enqueue(item)
+        paths = list(self.queue.segments)
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+        self.queue.dequeue()
+        self.assertFalse(os.path.exists(paths[0]))
+
+        self.queue.close()
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        self.assertFalse(os.path.exists(self.queue.directory))
+
+
 class LLDequeTestCase(unittest.TestCase):
     """ Tests for linked list deque """
     def setUp(self):
@@ -273,6 +587,124 @@ class LLDequeTestCase(unittest.TestCase):
             self.assertEqual(item1, item2)
 
 
+class PersistentDequeTestCase(unittest.TestCase):
+    """ Tests for persistent deques """
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.deque = queue_and_stack.PersistentDeque()
+
+    def test_empty_is_empty(self):
+        """ Deque should start out empty """
+        self.assertTrue(self.deque.empty())
+
+    def test_remove_empty(self):
+        """ removing from an empty deque gives an index error """
+        with self.assertRaises(IndexError):
+            self.deque.remove_front()
+
+        with self.assertRaises(IndexError):
+            self.deque.remove_back()
+
+    def test_single_item(self):
+        """ A single item should be removable from either side """
+        for deque_ in [self.deque.add_front('a'), self.deque.add_back('a')]:
+            self.assertEqual('a', deque_.peek_front())
+            self.assertEqual('a', deque_.peek_back())
+            item, rest = deque_.remove_front()
+            self.assertEqual('a', item)
+            self.assertTrue(rest.empty())
+
+            item, rest = deque_.remove_back()
+            self.assertEqual('a', item)
+            self.assertTrue(rest.empty())
+
+    def test_in_order_removal(self):
+        """ Adds on one side should come out in order from the other side """
+        reference = [129, 277, -93, 874, 9115, -8766, 8998, 5549, 10]
+        for item in reference:
+            self.deque = self.deque.add_back(item)
+        self.assertEqual(reference, list(self.deque))
+
+        test = []
+        while not self.deque.empty():
+            item, self.deque = self.deque.remove_front()
+            test.append(item)
+        self.assertEqual(reference, test)
+
+    def test_versions_match_model(self):
+        """ Random operations on random old versions should match list copies """
+        random = Random(2)
+        versions = [(self.deque, [])]
+        for step in range(2000):
+            deque_, model = random.choice(versions)
+            action = random.randrange(4)
+            if action == 0:
+                deque_, model = deque_.add_front(step), [step] + model
+            elif action == 1:
+                deque_, model = deque_.add_back(step), model + [step]
+            elif not model:
+                continue
+            elif action == 2:
+                item, deque_ = deque_.remove_front()
+                self.assertEqual(model[0], item)
+                model = model[1:]
+            else:
+                item, deque_ = deque_.remove_back()
+                self.assertEqual(model[-1], item)
+                model = model[:-1]
+            versions.append((deque_, model))
+
+        for deque_, model in versions:
+            self.assertEqual(model, list(deque_))
+            self.assertEqual(len(model), len(deque_))
+
+    def test_long_single_line(self):
+        """ Many operations on one line of versions should not build up lazy work
+            deep enough to hit the recursion limit """
+        random = Random(4)
+        model = deque()
+        for step in range(200000):
+            action = random.randrange(4)
+            if action == 0 or len(model) < 2:
+                self.deque = self.deque.add_front(step)
+                model.appendleft(step)
+            elif action == 1:
+                self.deque = self.deque.add_back(step)
+                model.append(step)
+            elif action == 2:
+                item, self.deque = self.deque.remove_front()
+                self.assertEqual(model.popleft(), item)
+            else:
+                item, self.deque = self.deque.remove_back()
+                self.assertEqual(model.pop(), item)
+        self.assertEqual(list(model), list(self.deque))
+
+    def test_branching_shares_rebuild(self):
+        """ Children branched from one large version should share its lazy
+            rebuilds instead of each redoing them """
+        for item in range(100000):
+            self.deque = self.deque.add_back(item)
+        parent = self.deque
+
+        fronts = set()
+        for child in range(1000):
+            item, rest = parent.add_back(-child).remove_front()
+            self.assertEqual(0, item)
+            fronts.add(id(rest.front))
+
+            item, rest = parent.add_front(-child).remove_front()
+            self.assertEqual(-child, item)
+            self.assertIs(parent.front, rest.front)
+            self.assertIs(parent.back, rest.back)
+            item, rest = rest.remove_front()
+            self.assertEqual(0, item)
+            fronts.add(id(rest.front))
+
+        # every child reached the same memoized front cell of the parent
+        self.assertEqual({id(parent.front.force()[1])}, fronts)
+        self.assertEqual(list(range(100000)), list(parent))
+
+
 class RandomizedQueueTestCase(unittest.TestCase):
     """ Tests for queues """
     def setUp(self):
@@ -313,5 +745,128 @@ class RandomizedQueueTestCase(unittest.TestCase):
         same_spots = sum(x == y for x, y in zip(reference, test))
         self.assertLess(same_spots, 10, 'This is a stupid test.  It may fail.')
 
+
+class DaryHeapTestCase(unittest.TestCase):
+    """ Tests for d-ary heap priority queues """
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.reference = Random(0).sample(range(-500, 500), 200)
+
+    def test_empty_is_empty(self):
+        """ Heap should start out emtpy """
+        self.assertTrue(queue_and_stack.DaryHeap().empty())
+
+    def test_pop_empty(self):
+        """ popping an empty heap gives an index error """
+        with self.assertRaises(IndexError):
+            queue_and_stack.DaryHeap().pop()
+
+    def test_sorted_order(self):
+        """ Pushed and heapified items should pop in sorted order for any d """
+        for d in [2, 3, 4, 8]:
+            heap = queue_and_stack.DaryHeap(self.reference[:100], d=d)
+            for item in self.reference[100:]:
+                heap.push(item)
+            self.assertEqual(min(self.reference), heap.peek())
+            self.assertEqual(sorted(self.reference)[:10], heap.pop_many(10))
+
+            test = []
+            while not heap.empty():
+                test.append(heap.pop())
+            self.assertEqual(sorted(self.reference)[10:], test)
+
+    def test_pop_many_more_than_size(self):
+        """ pop_many should stop when the heap is empty """
+        heap = queue_and_stack.DaryHeap([3, 1, 2])
+        self.assertEqual([1, 2, 3], heap.pop_many(5))
+        self.assertTrue(heap.empty())
+
+
+class IndexedDaryHeapTestCase(unittest.TestCase):
+    """ Tests for indexed d-ary heap priority queues """
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.heap = queue_and_stack.IndexedDaryHeap(d=3)
+
+    def test_pop_empty(self):
+        """ popping an empty heap gives an index error """
+        with self.assertRaises(IndexError):
+            self.heap.pop()
+
+    def test_heapify(self):
+        """ Constructing from pairs should pop items in priority order """
+        heap = queue_and_stack.IndexedDaryHeap([('c', 3), ('a', 1), ('b', 2)])
+        self.assertEqual(['a', 'b', 'c'], heap.pop_many(3))
+
+    def test_heapify_after_priority_change(self):
+        """ heapify should restore order after priorities are changed in place """
+        for priority, item in enumerate('abcde'):
+            self.heap.push(item, priority)
+        self.heap.priorities[self.heap.items.index('a')] = 10
+        self.heap.heapify()
+        self.assertEqual(['b', 'c', 'd', 'e', 'a'], self.heap.pop_many(5))
+
+    def test_decrease_key(self):
+        """ Decreasing a priority should move the item forward """
+        handles = {item: self.heap.push(item, priority)
+                   for priority, item in enumerate('abcdefg')}
+        self.heap.decrease_key(handles['f'], -1)
+        self.assertEqual(-1, self.heap.priority(handles['f']))
+        self.assertEqual('f', self.heap.peek())
+
+        with self.assertRaises(ValueError):
+            self.heap.decrease_key(handles['a'], 10)
+
+    def test_remove(self):
+        """ Removed items should not be popped and their handles go stale """
+        handles = {item: self.heap.push(item, priority)
+                   for priority, item in enumerate('abcdefg')}
+        self.assertEqual('a', self.heap.remove(handles['a']))
+        self.assertEqual('d', self.heap.remove(handles['d']))
+        self.assertNotIn(handles['d'], self.heap)
+        with self.assertRaises(KeyError):
+            self.heap.remove(handles['d'])
+
+        self.assertEqual(['b', 'c', 'e', 'f', 'g'], self.heap.pop_many(10))
+
+    def test_stale_handle_after_push(self):
+        """ A removed handle should stay stale after its storage is reused """
+        old = self.heap.push('old', 1)
+        self.heap.remove(old)
+        new = self.heap.push('new', 2)
+
+        self.assertNotEqual(old, new)
+        self.assertNotIn(old, self.heap)
+        with self.assertRaises(KeyError):
+            self.heap.decrease_key(old, 0)
+        with self.assertRaises(KeyError):
+            self.heap.remove(old)
+        self.assertEqual('new', self.heap.pop())
+
+    def test_random_operations(self):
+        """ Random pushes, decreases and removals should match a brute force model """
+        random = Random(1)
+        model = {}
+        handles = {}
+        for step in range(2000):
+            action = random.random()
+            if action < 0.5 or not model:
+                priority = random.randint(0, 1000)
+                handles[step] = self.heap.push(step, priority)
+                model[handles[step]] = priority
+            elif action < 0.7:
+                handle = random.choice(list(model))
+                model[handle] -= random.randint(0, 100)
+                self.heap.decrease_key(handle, model[handle])
+            elif action < 0.8:
+                handle = random.choice(list(model))
+                self.heap.remove(handle)
+                del model[handle]
+            else:
+                handle = handles[self.heap.pop()]
+                self.assertEqual(min(model.values()), model[handle])
+                del model[handle]
+            self.assertEqual(len(model), len(self.heap))
+
 if __name__ == '__main__':
     unittest.main()